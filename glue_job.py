@@ -1,11 +1,12 @@
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 from awsglue.transforms import *
 from awsglue.utils import getResolvedOptions
+from pyspark import StorageLevel
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
-from pyspark.sql.functions import col, explode, lit, current_timestamp, to_timestamp
+from pyspark.sql.functions import col, explode, lit, count, approx_count_distinct, to_timestamp, year, month, dayofmonth
 from pyspark.sql.types import StructType, StructField, StringType, LongType, ArrayType, TimestampType
 
 # Define expected schema
@@ -37,52 +38,30 @@ def get_expected_schema():
         StructField("channel_info", channel_schema, True)
     ])
 
-def validate_schema(df, expected_schema):
+def get_date_paths(current_time):
     """
-    Validate the DataFrame schema against expected schema
+    Get date-based paths for input and output from the given run time
     """
-    try:
-        # Get the field names from both schemas
-        df_fields = set(df.schema.fieldNames())
-        expected_fields = set(expected_schema.fieldNames())
-        
-        missing_fields = expected_fields - df_fields
-        extra_fields = df_fields - expected_fields
-        
-        if missing_fields or extra_fields:
-            print("Schema validation warning:")
-            if missing_fields:
-                print(f"Missing fields: {missing_fields}")
-            if extra_fields:
-                print(f"Extra fields: {extra_fields}")
-            
-        print("Schema validation completed")
-        return True
-    except Exception as e:
-        print(f"Schema validation error: {str(e)}")
-        raise
-
-def get_date_paths():
-    """
-    Get current date-based paths for input and output
-    """
-    current_time = datetime.now()
-    year = current_time.year
-    month = str(current_time.month).zfill(2)
-    day = str(current_time.day).zfill(2)
+    month_str = str(current_time.month).zfill(2)
+    day_str = str(current_time.day).zfill(2)
     
-    date_path = f"year={year}/month={month}/day={day}"
+    date_path = f"year={current_time.year}/month={month_str}/day={day_str}"
     return {
-        'year': year,
-        'month': int(month),
-        'day': int(day),
+        'year': current_time.year,
+        'month': current_time.month,
+        'day': current_time.day,
         'date_path': date_path
     }
 
-def transform_data(glueContext, input_path, output_path):
+def transform_data(glueContext, input_path, output_path, processed_at, debug=False):
     """
     Transform raw JSON data into the desired format using PySpark.
+    processed_at is the UTC run time the input path was built from; the
+    output partition is derived from the same value.
+    Schema, sample and statistics output is only produced when debug is set,
+    so a normal run triggers a single pass over the input.
     """
+    cached_df = None
     try:
         print(f"Reading JSON data from: {input_path}")
         
@@ -90,10 +69,12 @@ def transform_data(glueContext, input_path, output_path):
         
         # Read the raw JSON data with schema
         expected_schema = get_expected_schema()
-        raw_df = spark.read.schema(expected_schema).json(input_path)
-        
-        # Validate initial schema
-        validate_schema(raw_df, expected_schema)
+        # Fail fast on malformed records instead of nulling them and tracking
+        # them in a corrupt-record column
+        raw_df = spark.read \
+            .schema(expected_schema) \
+            .option("mode", "FAILFAST") \
+            .json(input_path)
         
         # Convert and transform the data
         exploded_df = raw_df.select(
@@ -101,8 +82,17 @@ def transform_data(glueContext, input_path, output_path):
             explode(col("videos")).alias("video")
         )
 
-        # Extract channel info with explicit column selection and type casting
-        channel_df = exploded_df.select(
+        # Project video and channel columns together; every exploded row already
+        # carries its own channel_info, so no join is needed to re-attach it
+        transformed_df = exploded_df.select(
+            col("video.video_id"),
+            col("video.title").alias("video_title"),
+            col("video.description").alias("video_description"),
+            to_timestamp(col("video.published_at")).alias("published_at"),
+            col("video.view_count").cast("long"),
+            col("video.like_count").cast("long"),
+            col("video.comment_count").cast("long"),
+            col("video.duration"),
             col("channel_info.channel_id"),
             col("channel_info.title").alias("channel_title"),
             col("channel_info.description").alias("channel_description"),
@@ -112,52 +102,49 @@ def transform_data(glueContext, input_path, output_path):
             col("channel_info.view_count").cast("long"),
             col("channel_info.playlist_id")
         )
-        
-        # Transform videos with proper timestamp and type conversion
-        videos_df = exploded_df.select(
-            col("channel_info.channel_id").alias("vid_channel_id"),
-            col("video.video_id"),
-            col("video.title").alias("video_title"),
-            col("video.description").alias("video_description"),
-            to_timestamp(col("video.published_at")).alias("published_at"),
-            col("video.view_count").cast("long"),
-            col("video.like_count").cast("long"),
-            col("video.comment_count").cast("long"),
-            col("video.duration")
-        )
-
-        # Join channel info with videos
-        transformed_df = videos_df.join(channel_df, videos_df.vid_channel_id == channel_df.channel_id, "inner")
 
-        transformed_df = transformed_df.drop('vid_channel_id')
+        # Drop rows without a channel_id, as the former inner join on it did
+        transformed_df = transformed_df.filter(col("channel_id").isNotNull())
 
-        # Get current date information
-        date_info = get_date_paths()
-        
-        # Add partition columns based on current date
+        # Add partition columns derived from the processing timestamp, which
+        # is the same run time the input path was built from
         transformed_df = transformed_df \
-            .withColumn("year", lit(date_info['year'])) \
-            .withColumn("month", lit(date_info['month'])) \
-            .withColumn("day", lit(date_info['day'])) \
-            .withColumn("processed_timestamp", current_timestamp())
-
-        print("\nTransformed Data Schema:")
-        transformed_df.printSchema()
-        
-        print("\nSample of transformed data:")
-        transformed_df.show(5, truncate=False)
-
-        # Display some statistics
-        print("\nTransformation Statistics:")
-        video_count = transformed_df.count()
-        channel_count = transformed_df.select("channel_id").distinct().count()
-        print(f"Total videos processed: {video_count}")
-        print(f"Total unique channels: {channel_count}")
-        
+            .withColumn("processed_timestamp", lit(processed_at)) \
+            .withColumn("year", year("processed_timestamp")) \
+            .withColumn("month", month("processed_timestamp")) \
+            .withColumn("day", dayofmonth("processed_timestamp"))
+
+        if debug:
+            # Keep the result around so the debug actions and the write below
+            # don't each re-read and re-parse the JSON input
+            transformed_df = cached_df = transformed_df.persist(StorageLevel.MEMORY_AND_DISK)
+
+            print("\nTransformed Data Schema:")
+            transformed_df.printSchema()
+            
+            print("\nSample of transformed data:")
+            transformed_df.show(5, truncate=False)
+
+            # Display some statistics, gathered in a single aggregation pass
+            print("\nTransformation Statistics:")
+            video_count, channel_count = transformed_df.select(
+                count(lit(1)),
+                approx_count_distinct("channel_id")
+            ).collect()[0]
+            print(f"Total videos processed: {video_count}")
+            print(f"Total unique channels: {channel_count}")
 
         # Write the transformed data to S3 in Parquet format
+        # A run only ever produces one date partition, so route all rows to a
+        # single task to write one file per partition instead of one per task
         print(f"\nWriting transformed data to: {output_path}")
-        transformed_df.write \
+        # Zstd keeps the string-heavy title/description columns smaller than
+        # the default Snappy, and dictionary encoding collapses the repeated
+        # channel columns
+        transformed_df.repartition(1, "year", "month", "day").write \
+            .option("compression", "zstd") \
+            .option("parquet.enable.dictionary", "true") \
+            .option("parquet.block.size", str(128 * 1024 * 1024)) \
             .partitionBy("year", "month", "day") \
             .mode("overwrite") \
             .parquet(output_path.rstrip('/'))
@@ -168,6 +155,11 @@ def transform_data(glueContext, input_path, output_path):
         print(f"Error during transformation: {str(e)}")
         raise
 
+    finally:
+        # Release the debug cache even if the write failed
+        if cached_df is not None:
+            cached_df.unpersist()
+
 def main():
     """
     Main function to run the Glue job
@@ -175,23 +167,41 @@ def main():
     try:
         # Get job arguments
         args = getResolvedOptions(sys.argv, ['JOB_NAME'])
+        debug = False
+        if '--DEBUG' in sys.argv:
+            debug = getResolvedOptions(sys.argv, ['DEBUG'])['DEBUG'].lower() == 'true'
         
         # Initialize Glue context
         sc = SparkContext()
         glueContext = GlueContext(sc)
         spark = glueContext.spark_session
+
+        # Evaluate year/month/day of timestamps in UTC, matching the UTC run
+        # time used for the input path
+        spark.conf.set("spark.sql.session.timeZone", "UTC")
+
+        # The payload is small, so use few shuffle partitions and let adaptive
+        # query execution coalesce them further and split any skewed joins
+        spark.conf.set("spark.sql.adaptive.enabled", "true")
+        spark.conf.set("spark.sql.adaptive.coalescePartitions.enabled", "true")
+        spark.conf.set("spark.sql.adaptive.coalescePartitions.minPartitionSize", "16m")
+        spark.conf.set("spark.sql.adaptive.skewJoin.enabled", "true")
+        spark.conf.set("spark.sql.shuffle.partitions", "8")
+
         job = Job(glueContext)
         job.init(args['JOB_NAME'], args)
 
-        # Get date-based paths
-        date_info = get_date_paths()
+        # Get date-based paths from a single run time, shared with the output
+        # partition so the raw and transform days always match
+        processed_at = datetime.now(timezone.utc)
+        date_info = get_date_paths(processed_at)
         
         # Construct input and output paths
         input_path = f"s3://iit-matrix-test/raw/{date_info['date_path']}/"
         output_path = "s3://iit-matrix-test/transform/"
 
         # Transform the data
-        transform_data(glueContext, input_path, output_path)
+        transform_data(glueContext, input_path, output_path, processed_at, debug=debug)
         
         # Commit the job
         job.commit()
@@ -1,40 +1,80 @@
+import heapq
 import json
 import os
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter
 import logging
-from googleapiclient.discovery import build
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import boto3
+import orjson
+import requests
 from botocore.exceptions import ClientError
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+YOUTUBE_API_URL = 'https://www.googleapis.com/youtube/v3'
+# (connect, read) timeouts in seconds; requests has no default timeout
+YOUTUBE_API_TIMEOUT = (5, 30)
+
+# Fields of each video record kept in the top videos summary
+TOP_VIDEO_KEYS = ('title', 'video_id', 'view_count', 'published_at')
+
+# Created once per container and reused across warm invocations
+s3_client = boto3.client('s3')
+executor = ThreadPoolExecutor(max_workers=5)
+extractors = {}
+
+# Playlist pages are prefetched on a separate pool so they never queue
+# behind the channel tasks that are waiting for them
+page_executor = ThreadPoolExecutor(max_workers=5)
+
 class YouTubeExtractor:
     def __init__(self, api_key):
-        self.youtube = build('youtube', 'v3', developerKey=api_key)
+        self.api_key = api_key
+        # requests does not document Session as thread-safe, and the channel
+        # and page-prefetch workers call the API concurrently, so each worker
+        # thread keeps its own session
+        self.thread_state = threading.local()
+
+    def _session(self):
+        # A persistent session keeps HTTPS connections to the API alive
+        # across calls instead of a new TLS handshake per request
+        session = getattr(self.thread_state, 'session', None)
+        if session is None:
+            session = self.thread_state.session = requests.Session()
+            session.params = {'key': self.api_key}
+        return session
+
+    def _get(self, resource, **params):
+        response = self._session().get(f"{YOUTUBE_API_URL}/{resource}", params=params, timeout=YOUTUBE_API_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
 
     def get_channel_info(self, channel_identifier):
         try:
             # Check if identifier is a channel ID
             if not channel_identifier.startswith('UC'):
-                search_response = self.youtube.search().list(
+                search_response = self._get(
+                    'search',
                     q=channel_identifier,
                     type='channel',
                     part='id',
                     maxResults=1
-                ).execute()
+                )
                 if not search_response['items']:
                     return None
                 channel_id = search_response['items'][0]['id']['channelId']
             else:
                 channel_id = channel_identifier
 
-            channel_response = self.youtube.channels().list(
+            channel_response = self._get(
+                'channels',
                 part='snippet,statistics,contentDetails',
                 id=channel_id
-            ).execute()
+            )
 
             if not channel_response['items']:
                 return None
@@ -55,60 +95,114 @@ class YouTubeExtractor:
             return None
 
     def get_channel_videos(self, playlist_id, max_results=50):
+        next_page = None
         try:
             videos = []
-            next_page_token = None
-
-            while True:
-                playlist_response = self.youtube.playlistItems().list(
-                    part='snippet,contentDetails',
-                    playlistId=playlist_id,
-                    maxResults=min(50, max_results - len(videos)),
-                    pageToken=next_page_token
-                ).execute()
-
-                video_ids = [item['contentDetails']['videoId'] for item in playlist_response['items']]
-                video_response = self.youtube.videos().list(
-                    part='statistics,contentDetails',
-                    id=','.join(video_ids)
-                ).execute()
-
-                for playlist_item, video_item in zip(playlist_response['items'], video_response['items']):
-                    videos.append({
-                        'video_id': playlist_item['contentDetails']['videoId'],
+            top_videos = []
+            video_trends = Counter()
+
+            # published_at is a fixed-width ISO-8601 string, so string
+            # comparison against a cutoff formatted the same way orders it
+            # correctly and the first 7 characters are the YYYY-MM month key
+            twelve_months_ago = datetime.utcnow() - timedelta(days=365)
+            trend_cutoff = twelve_months_ago.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+            playlist_response = self._get(
+                'playlistItems',
+                part='snippet,contentDetails',
+                playlistId=playlist_id,
+                maxResults=min(50, max_results)
+            )
+
+            while playlist_response is not None:
+                playlist_items = playlist_response['items']
+                video_ids = [item['contentDetails']['videoId'] for item in playlist_items]
+                next_page_token = playlist_response.get('nextPageToken')
+                remaining = max_results - len(videos) - len(playlist_items)
+
+                # Fetch the next playlist page in the background while this
+                # page's video details are requested
+                next_page = None
+                if next_page_token and remaining > 0:
+                    next_page = page_executor.submit(
+                        self._get,
+                        'playlistItems',
+                        part='snippet,contentDetails',
+                        playlistId=playlist_id,
+                        maxResults=min(50, remaining),
+                        pageToken=next_page_token
+                    )
+
+                # Deleted or private videos are missing from the videos
+                # response, so match details by ID rather than by position
+                video_map = {}
+                if video_ids:
+                    video_response = self._get(
+                        'videos',
+                        part='statistics,contentDetails',
+                        id=','.join(video_ids)
+                    )
+                    video_map = {item['id']: item for item in video_response['items']}
+
+                for playlist_item in playlist_items:
+                    video_id = playlist_item['contentDetails']['videoId']
+                    video_item = video_map.get(video_id, {})
+                    statistics = video_item.get('statistics', {})
+                    video = {
+                        'video_id': video_id,
                         'title': playlist_item['snippet']['title'],
                         'description': playlist_item['snippet']['description'],
                         'published_at': playlist_item['snippet']['publishedAt'],
-                        'view_count': video_item['statistics'].get('viewCount', 0),
-                        'like_count': video_item['statistics'].get('likeCount', 0),
-                        'comment_count': video_item['statistics'].get('commentCount', 0),
-                        'duration': video_item['contentDetails']['duration']
-                    })
+                        'view_count': statistics.get('viewCount', 0),
+                        'like_count': statistics.get('likeCount', 0),
+                        'comment_count': statistics.get('commentCount', 0),
+                        'duration': video_item.get('contentDetails', {}).get('duration')
+                    }
+                    videos.append(video)
 
-                next_page_token = playlist_response.get('nextPageToken')
-                if not next_page_token or len(videos) >= max_results:
-                    break
+                    # Track the top 10 videos by views as videos arrive rather
+                    # than re-scanning them later.
+                    # -len(videos) keeps earlier videos first on equal views.
+                    entry = (int(video['view_count']), -len(videos), video)
+                    if len(top_videos) < 10:
+                        heapq.heappush(top_videos, entry)
+                    else:
+                        heapq.heappushpop(top_videos, entry)
+
+                # Count this page's videos per month for the last 12 months
+                video_trends.update(
+                    published_at[:7]
+                    for item in playlist_items
+                    if (published_at := item['snippet']['publishedAt']) >= trend_cutoff
+                )
 
-            return videos
+                playlist_response = next_page.result() if next_page else None
+
+            top_videos = [video for _, _, video in sorted(top_videos, reverse=True)]
+            return videos, top_videos, dict(video_trends)
         except Exception as e:
             logger.error(f"Error getting channel videos: {e}")
-            return None
+            # Don't leave a page prefetch running once this channel has failed
+            if next_page is not None and not next_page.cancel():
+                wait([next_page])
+            return None, None, None
+
+def get_extractor(api_key):
+    if api_key not in extractors:
+        extractors[api_key] = YouTubeExtractor(api_key)
+    return extractors[api_key]
 
 def upload_to_s3(data, bucket, key):
     try:
-        s3_client = boto3.client('s3')
-        s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(data, ensure_ascii=False))
+        s3_client.put_object(Bucket=bucket, Key=key, Body=orjson.dumps(data))
         logger.info(f"Successfully uploaded to s3://{bucket}/{key}")
         return True
     except ClientError as e:
         logger.error(f"S3 upload error: {e}")
         return False
 
-def analyze_channel_data(channel_data, videos_data):
-    # Get current time and 12 months ago
-    current_time = datetime.utcnow()
-    twelve_months_ago = current_time - timedelta(days=365)
-
+def analyze_channel_data(channel_data, top_videos, video_trends):
+    # top_videos and video_trends are aggregated during extraction
     analysis = {
         'channel_stats': {
             'name': channel_data['title'],
@@ -116,30 +210,9 @@ def analyze_channel_data(channel_data, videos_data):
             'total_videos': channel_data['video_count'],
             'total_views': channel_data['view_count']
         },
-        'video_trends': defaultdict(int),
-        'top_videos': []
+        'video_trends': video_trends,
+        'top_videos': [{key: video[key] for key in TOP_VIDEO_KEYS} for video in top_videos]
     }
-
-    # Process videos
-    videos_by_views = sorted(videos_data, key=lambda x: int(x['view_count']), reverse=True)
-    
-    # Get top 10 videos
-    analysis['top_videos'] = [{
-        'title': video['title'],
-        'video_id': video['video_id'],
-        'view_count': video['view_count'],
-        'published_at': video['published_at']
-    } for video in videos_by_views[:10]]
-
-    # Count videos per month for the last 12 months
-    for video in videos_data:
-        published_date = datetime.strptime(video['published_at'], "%Y-%m-%dT%H:%M:%SZ")
-        if published_date >= twelve_months_ago:
-            month_key = published_date.strftime('%Y-%m')
-            analysis['video_trends'][month_key] += 1
-
-    # Convert defaultdict to regular dict for JSON serialization
-    analysis['video_trends'] = dict(analysis['video_trends'])
     
     return analysis
 
@@ -149,14 +222,14 @@ def lambda_handler(event, context):
         S3_BUCKET = os.environ['S3_BUCKET_NAME']
         channels = ['@straitstimesonline', '@TheBusinessTimes', '@Tamil_Murasu', '@zaobaodotsg', '@BeritaHarianSG1957']
 
-        extractor = YouTubeExtractor(API_KEY)
-        
-        for channel in channels:
+        extractor = get_extractor(API_KEY)
+
+        def process_channel(channel):
             channel_info = extractor.get_channel_info(channel)
             if channel_info:
-                videos = extractor.get_channel_videos(channel_info['playlist_id'], max_results=100)
+                videos, top_videos, video_trends = extractor.get_channel_videos(channel_info['playlist_id'], max_results=100)
                 if videos:
-                    analysis = analyze_channel_data(channel_info, videos)
+                    analysis = analyze_channel_data(channel_info, top_videos, video_trends)
                     
                     # Generate timestamp for the filename
                     timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
@@ -169,6 +242,14 @@ def lambda_handler(event, context):
                         'analysis': analysis
                     }, S3_BUCKET, key)
 
+        # Channels are independent and I/O-bound, so fetch them concurrently.
+        # Wait for every channel before returning, even if one fails, so no
+        # upload is still running when Lambda freezes the container.
+        futures = [executor.submit(process_channel, channel) for channel in channels]
+        wait(futures)
+        for future in futures:
+            future.result()
+
         return {
             'statusCode': 200,
             'body': json.dumps('YouTube data extraction completed successfully')